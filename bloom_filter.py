@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import hashlib
+import math
+import struct
+
+class BloomFilter:
+    "Probabilistic set of strings.  No false negative, but few false positives"
+    magic = b'STBLOOM1'
+    nr_bits = None
+    nr_hashes = None
+    bits = None
+
+    def __init__(self, nr_items, false_positive_rate=0.001):
+        nr_items = max(nr_items, 1)
+        self.nr_bits = int(-nr_items * math.log(false_positive_rate) /
+                (math.log(2) ** 2)) + 1
+        self.nr_hashes = max(int(self.nr_bits / nr_items * math.log(2)), 1)
+        self.bits = bytearray((self.nr_bits + 7) // 8)
+
+    def indices(self, item):
+        digest = hashlib.sha1(item.encode()).digest()
+        h1, h2 = struct.unpack('<QQ', digest[:16])
+        return [(h1 + i * h2) % self.nr_bits for i in range(self.nr_hashes)]
+
+    def add(self, item):
+        for idx in self.indices(item):
+            self.bits[idx // 8] |= 1 << (idx % 8)
+
+    def __contains__(self, item):
+        for idx in self.indices(item):
+            if not self.bits[idx // 8] & (1 << (idx % 8)):
+                return False
+        return True
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.magic)
+            f.write(struct.pack('<QQ', self.nr_bits, self.nr_hashes))
+            f.write(self.bits)
+
+def load_bloom_filter(path):
+    with open(path, 'rb') as f:
+        if f.read(len(BloomFilter.magic)) != BloomFilter.magic:
+            return None
+        nr_bits, nr_hashes = struct.unpack('<QQ', f.read(16))
+        bits = bytearray(f.read())
+    if len(bits) != (nr_bits + 7) // 8:
+        return None
+    bloom = BloomFilter(1)
+    bloom.nr_bits = nr_bits
+    bloom.nr_hashes = nr_hashes
+    bloom.bits = bits
+    return bloom
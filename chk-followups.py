@@ -1,23 +1,51 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import os
+import pickle
+import queue
+import re
 import subprocess
+import threading
+import time
 
+from bloom_filter import *
 from track_results import *
+import git
+import history
+import progress
 
 title_hash_maps = {}
+# revision ranges of which all titles are in title_hash_maps
+filled_ranges = set()
+# serializes updates of the above and 'hash_by_ref.cache' from the workers
+caches_lock = threading.Lock()
+# serializes building the caches that read whole ranges, to build those once
+build_lock = threading.Lock()
+upstream_title_filters = {}
+# {revision range: {normalized title: hash}}
+normalized_title_maps = {}
+# {downstream range: [{upstream hash prefix length: {prefix: downstream hash}},
+#                     {downstream title: [upstream hash ...]}]}
+backport_indexes = {}
 
 def hash_by_title(title, revision_range, repo):
-    if not revision_range in title_hash_maps:
-        title_hash_maps[revision_range] = {}
-    cache = title_hash_maps[revision_range]
+    with caches_lock:
+        cache = title_hash_maps.setdefault(revision_range, {})
     if title in cache:
+        progress.count('title_hash_hits')
         return cache[title]
+    if revision_range in filled_ranges:
+        progress.count('title_hash_hits')
+        return None
+    progress.count('title_hash_misses')
 
     keyword = title.replace('\'', '\'"\'"\'')
     cmd = 'git --git-dir=%s/.git log --oneline %s --abbrev=12' % (
             repo, revision_range)
     cmd += ' | grep -F \'%s\' -m 1' % keyword
+    progress.count('git_calls')
     try:
         result = subprocess.check_output(cmd, shell=True).decode()
         commit_hash = result[:12]
@@ -28,14 +56,130 @@ def hash_by_title(title, revision_range, repo):
             if len(boundaries) == 2:
                 new_range = '%s..%s' % (boundaries[0], new_range)
             return hash_by_title(title, new_range, repo)
-        cache[title] = commit_hash
+        with caches_lock:
+            cache[title] = commit_hash
         return commit_hash
     except:
         return None
 
+default_title_decorations = [
+        r'^(UPSTREAM|BACKPORT|FROMGIT|FROMLIST|CHROMIUM|ANDROID)\s*:\s*',
+        r'^\[[^\]]*\]\s*']
+
+def normalize_title(title):
+    "Strip the decorations of the title, collapse spaces, and lower the case"
+    changed = True
+    while changed:
+        changed = False
+        for decoration in normalize_title.decorations:
+            stripped = decoration.sub('', title.strip(), count=1)
+            if stripped != title:
+                title = stripped
+                changed = True
+    return ' '.join(title.split()).lower()
+normalize_title.decorations = None
+
+def read_title_decorations(decorations_file):
+    decorations = []
+    with open(decorations_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            decorations.append(line)
+    return decorations
+
+def fill_normalized_title_map(revision_range, repo):
+    with build_lock:
+        if revision_range in normalized_title_maps:
+            return
+        normalized_map = {}
+        git_cmd = ['git', '--git-dir=%s/.git' % repo]
+        git_cmd += ['log', '--pretty=%h %s', '--abbrev=12', revision_range]
+        progress.count('git_calls')
+        try:
+            output = subprocess.check_output(git_cmd).decode(errors='replace')
+        except:
+            print('failed getting the commits in %s' % revision_range)
+            exit(1)
+        for line in output.strip().split('\n'):
+            if not line:
+                continue
+            normalized = normalize_title(line[13:])
+            if not normalized in normalized_map:
+                normalized_map[normalized] = line[:12]
+        normalized_title_maps[revision_range] = normalized_map
+
+def hash_by_normalized_title(title, revision_range, repo):
+    if not revision_range in normalized_title_maps:
+        fill_normalized_title_map(revision_range, repo)
+    return normalized_title_maps[revision_range].get(normalize_title(title))
+
+def set_backport_index(downstream, repo):
+    by_upstream = {}
+    by_title = {}
+    git_cmd = ['git', '--git-dir=%s/.git' % repo]
+    git_cmd += ['log', '--pretty=%H%x00%s%x00%B%x00', downstream]
+    progress.count('git_calls')
+    try:
+        fields = subprocess.check_output(git_cmd).decode(
+                errors='replace').split('\0')
+    except:
+        print('failed getting the downstream commits')
+        exit(1)
+
+    for idx in range(0, len(fields) - 2, 3):
+        down_hash = fields[idx].strip()
+        title = fields[idx + 1]
+        up_hashes = parse_upstream_trailers(fields[idx + 2])
+        if not up_hashes:
+            continue
+        if not title in by_title:
+            by_title[title] = up_hashes
+        for h in up_hashes:
+            if not len(h) in by_upstream:
+                by_upstream[len(h)] = {}
+            if not h in by_upstream[len(h)]:
+                by_upstream[len(h)][h] = down_hash[:12]
+    backport_indexes[downstream] = [by_upstream, by_title]
+
+def is_ancestor(hashid, ref, repo):
+    git_cmd = ['git', '--git-dir=%s/.git' % repo]
+    git_cmd += ['merge-base', '--is-ancestor', hashid, ref]
+    progress.count('git_calls')
+    return subprocess.call(git_cmd, stderr=subprocess.DEVNULL) == 0
+
+def in_revision_range(hashid, revision_range, repo):
+    boundaries = revision_range.split('..')
+    if not is_ancestor(hashid, boundaries[-1], repo):
+        return False
+    if len(boundaries) == 2 and is_ancestor(hashid, boundaries[0], repo):
+        return False
+    return True
+
+def upstream_hash_by_trailer(title, upstream, downstream, repo):
+    "Return the upstream commit that the downstream commit is backported from"
+    if not downstream in backport_indexes:
+        return None
+    for h in backport_indexes[downstream][1].get(title, []):
+        if in_revision_range(h, upstream, repo):
+            return h
+    return None
+
+def downstream_hash_by_trailer(commit_hash, downstream):
+    "Return the downstream commit that is backported from the upstream commit"
+    if not downstream in backport_indexes:
+        return None
+    by_upstream = backport_indexes[downstream][0]
+    for prefix_len in by_upstream:
+        if commit_hash[:prefix_len] in by_upstream[prefix_len]:
+            return by_upstream[prefix_len][commit_hash[:prefix_len]]
+    return None
+
 def touched_files(gitref, repo):
     git_cmd = ['git', '--git-dir=%s/.git' % repo]
     git_cmd += ['show', '%s' % gitref, '--pretty=', '--name-only']
+    progress.count('git_calls')
     return subprocess.check_output(git_cmd).decode().strip().split('\n')
 
 def hashes_in(base, to, repo, target_files):
@@ -43,6 +187,7 @@ def hashes_in(base, to, repo, target_files):
     git_cmd += ['log', '%s..%s' % (base, to), '--pretty=%H']
     if target_files:
         git_cmd += ['--'] + target_files.split()
+    progress.count('git_calls')
     return subprocess.check_output(git_cmd).decode().strip().split('\n')
 
 def track_commit(commit, repo, upstream, downstream, track_all_files):
@@ -70,19 +215,30 @@ def track_commit(commit, repo, upstream, downstream, track_all_files):
         else:
             continue
 
-        followups[1] = hash_by_title(upstream_commit.title, downstream, repo)
+        followups[1] = downstream_hash_by_trailer(upstream_commit.commit_hash,
+                downstream)
+        if not followups[1]:
+            followups[1] = hash_by_title(upstream_commit.title, downstream,
+                    repo)
+        if not followups[1] and normalize_title.decorations != None:
+            followups[1] = hash_by_normalized_title(upstream_commit.title,
+                    downstream, repo)
 
     return result
 
 def hash_by_ref(reference, repo):
-    if not repo in hash_by_ref.cache:
-        hash_by_ref.cache[repo] = {}
-    if reference in hash_by_ref.cache[repo]:
-        return hash_by_ref.cache[repo][reference]
+    with caches_lock:
+        cache = hash_by_ref.cache.setdefault(repo, {})
+    if reference in cache:
+        progress.count('ref_hash_hits')
+        return cache[reference]
+    progress.count('ref_hash_misses')
 
     cmd = 'git --git-dir=%s/.git rev-parse %s' % (repo, reference)
+    progress.count('git_calls')
     hashid = subprocess.check_output(cmd, shell=True).decode().strip()
-    hash_by_ref.cache[repo][reference] = hashid
+    with caches_lock:
+        cache[reference] = hashid
     return hashid
 hash_by_ref.cache = {}
 
@@ -107,6 +263,7 @@ def comm_rev_ranges(range1, range2, repo):
     else:
         cmd = 'git --git-dir=%s/.git merge-base %s %s' % (repo,
                 range1[1], range2[1])
+        progress.count('git_calls')
         comm_end = subprocess.check_output(cmd, shell=True).decode().strip()
     if not comm_end:
         return None
@@ -118,10 +275,12 @@ def comm_rev_ranges(range1, range2, repo):
         cmd = 'git --git-dir=%s/.git log --pretty=%%h --abbrev=12 %s^..%s' % (
                 repo, range1[0], comm_end)
         cmd += ' --first-parent'
+        progress.count('git_calls')
         range1_commits = subprocess.check_output(cmd, shell=True).decode().strip().split('\n')
         cmd = 'git --git-dir=%s/.git log --pretty=%%h --abbrev=12 %s^..%s' % (
                 repo, range2[0], comm_end)
         cmd += ' --first-parent'
+        progress.count('git_calls')
         range2_commits = subprocess.check_output(cmd, shell=True).decode().strip().split('\n')
 
         if len(range1_commits) == 0 or len(range2_commits) == 0:
@@ -142,7 +301,17 @@ def comm_rev_ranges(range1, range2, repo):
     return [comm_start, comm_end]
 
 def track_from_scratch(title, repo, upstream, downstream, check_all_files):
-    h = hash_by_title(title, upstream, repo)
+    h = upstream_hash_by_trailer(title, upstream, downstream, repo)
+    if h:
+        c = Commit(h, repo)
+        return track_commit(c, repo, upstream, downstream, check_all_files)
+
+    h = None
+    if (not upstream in upstream_title_filters or
+            title in upstream_title_filters[upstream]):
+        h = hash_by_title(title, upstream, repo)
+    if not h and normalize_title.decorations != None:
+        h = hash_by_normalized_title(title, upstream, repo)
     if not h:
         return TrackResult(None)
 
@@ -168,13 +337,18 @@ def do_track(title, repo, upstream, downstream, downstream_prefix,
 
     pres = prev_results.results[title]
     if not do_track.upstreams_comm:
-        do_track.upstreams_comm = comm_rev_ranges(prev_up, now_up, repo)
+        with build_lock:
+            if not do_track.upstreams_comm:
+                do_track.upstreams_comm = comm_rev_ranges(prev_up, now_up,
+                        repo)
     comm = do_track.upstreams_comm
 
     # exclude track results that invalid due to changed upstream range
     exclude_ranges = ['%s..%s' % (prev_up[0], comm[0]),
             '%s..%s' % (comm[1], prev_up[1])]
     for r in exclude_ranges:
+        # the delta ranges are small, and shared by all titles
+        fill_title_hash_maps(r, repo)
         if hash_by_title(title, r, repo):
             # it's downstream only now
             return TrackResult(None)
@@ -198,7 +372,12 @@ def do_track(title, repo, upstream, downstream, downstream_prefix,
     include_ranges = ['%s..%s' % (now_up[0], comm[0]),
             '%s..%s' % (comm[1], now_up[1])]
     for r in include_ranges:
-        h = hash_by_title(title, r, repo)
+        fill_title_hash_maps(r, repo)
+        h = upstream_hash_by_trailer(title, r, downstream, repo)
+        if not h:
+            h = hash_by_title(title, r, repo)
+        if not h and normalize_title.decorations != None:
+            h = hash_by_normalized_title(title, r, repo)
         if not h:
             continue
         c = Commit(h, repo)
@@ -208,25 +387,48 @@ def do_track(title, repo, upstream, downstream, downstream_prefix,
         pres.followup_mentions += new_result.followup_mentions
 
     if not do_track.downstreams_comm:
-        do_track.downstreams_comm = comm_rev_ranges(prev_dn, now_dn, repo)
+        with build_lock:
+            if not do_track.downstreams_comm:
+                do_track.downstreams_comm = comm_rev_ranges(prev_dn, now_dn,
+                        repo)
     comm = do_track.downstreams_comm
 
     # exclude followup backports that invalid due to the changed downstream
     exclude_ranges = ['%s..%s' % (prev_dn[0], comm[0]),
             '%s..%s' % (comm[1], prev_dn[1])]
     for r in exclude_ranges:
+        fill_title_hash_maps(r, repo)
         for f in pres.followup_fixes + pres.followup_mentions:
             if f[1] and hash_by_title(f[0].title, r, repo):
                 # the backport of the followup is not in the current downstream
                 f[1] = None
 
+    # backports found by the trailers could have different titles
+    if prev_dn != now_dn:
+        for f in pres.followup_fixes + pres.followup_mentions:
+            if not f[1]:
+                continue
+            if downstream_hash_by_trailer(f[0].commit_hash, downstream):
+                continue
+            if hash_by_title(f[0].title, downstream, repo):
+                continue
+            if normalize_title.decorations != None and hash_by_normalized_title(
+                    f[0].title, downstream, repo):
+                continue
+            f[1] = None
+
     # include followup backports that made by the changed downstream range
     include_ranges = ['%s..%s' % (now_dn[0], comm[0]), '%s..%s' % (
         comm[1], now_dn[1])]
     for r in include_ranges:
+        fill_title_hash_maps(r, repo)
         for f in pres.followup_fixes + pres.followup_mentions:
+            if not f[1]:
+                f[1] = downstream_hash_by_trailer(f[0].commit_hash, downstream)
             if not f[1]:
                 f[1] = hash_by_title(f[0].title, r, repo)
+            if not f[1] and normalize_title.decorations != None:
+                f[1] = hash_by_normalized_title(f[0].title, r, repo)
 
     return pres
 do_track.upstreams_comm = None
@@ -275,31 +477,313 @@ def set_argparser(parser):
 
     parser.add_argument('--downstream_prefix', metavar='<prefix>',
             help='commits having titles with the prefix are downstream only')
+    parser.add_argument('--ignore_trailers', action='store_true',
+            help='do not find backports using the upstream commit trailers')
+    parser.add_argument('--normalize_titles', action='store_true',
+            help='compare titles after stripping decorations and case')
+    parser.add_argument('--title_decorations', metavar='<file>',
+            help='regexes of the title decorations to strip')
+    parser.add_argument('--upstream_filter_dir', metavar='<dir>',
+            help='directory to store and reuse the upstream titles filter')
+    parser.add_argument('--checkpoint', metavar='<file>',
+            help='periodically save the progress of the tracking in the file')
+    parser.add_argument('--checkpoint_interval', metavar='<seconds>',
+            type=int, default=300,
+            help='interval between the checkpoints')
+    parser.add_argument('--resume', action='store_true',
+            help='resume the tracking from the checkpoint')
+    parser.add_argument('--progress', action='store_true',
+            help='periodically print the progress of the tracking to stderr')
+    parser.add_argument('--progress_file', metavar='<file>',
+            help='periodically write the progress of the tracking in the file')
+    parser.add_argument('--progress_interval', metavar='<seconds>',
+            type=int, default=10,
+            help='interval between the progress reports')
+    parser.add_argument('--history', metavar='<dir>',
+            help='append the summary of the tracking to the history store')
+    parser.add_argument('--deadline', metavar='<seconds>', type=int,
+            help='stop the tracking after the seconds and report partially')
+    parser.add_argument('--priority', metavar='<file>',
+            help='file listing titles of the commits to track first')
+    parser.add_argument('--jobs', metavar='<number>', type=int, default=4,
+            help='number of threads tracking the commits in parallel')
+    parser.add_argument('--shard', metavar='<K/N>',
+            help='track only K-th of N partitions of the downstream commits')
     parser.description='track status of followup commits in the upstream.'
 
 def fill_title_hash_maps(downstream, repo):
-    if not downstream in title_hash_maps:
-        title_hash_maps[downstream] = {}
+    if downstream in filled_ranges:
+        return
 
-    cmd = 'git --git-dir=%s/.git log --pretty="%%h %%s" --abbrev=12 %s' % (
-            repo, downstream)
+    with build_lock:
+        if downstream in filled_ranges:
+            return
+
+        cmd = 'git --git-dir=%s/.git log --pretty="%%h %%s" --abbrev=12 %s' % (
+                repo, downstream)
+        progress.count('git_calls')
+        try:
+            results = subprocess.check_output(cmd, shell=True).decode()
+            title_hashes = []
+            for r in results.strip().split('\n'):
+                r = r.strip()
+                if not r:
+                    continue
+                title_hashes.append([r[13:], r[:12]])
+        except:
+            print('failed getting the commits in %s' % downstream)
+            exit(1)
+
+        with caches_lock:
+            cache = title_hash_maps.setdefault(downstream, {})
+            for title, hashid in title_hashes:
+                # keep the newest one, as 'hash_by_title()' does
+                cache.setdefault(title, hashid)
+            filled_ranges.add(downstream)
+
+def set_upstream_title_filter(upstream, repo, filter_dir):
+    tips = [hash_by_ref(x, repo) for x in upstream.split('..')]
+    path = os.path.join(filter_dir, 'upstream-titles-%s' % '-'.join(tips))
+    if os.path.isfile(path):
+        bloom = load_bloom_filter(path)
+        if bloom:
+            upstream_title_filters[upstream] = bloom
+            return
+
+    git_cmd = ['git', '--git-dir=%s/.git' % repo]
+    git_cmd += ['log', '--pretty=%s', upstream]
+    progress.count('git_calls')
     try:
-        results = subprocess.check_output(cmd, shell=True).decode()
-        titles = []
-        for r in results.strip().split('\n'):
-            r = r.strip()
-            hashid = r[:12]
-            title = r[13:]
-            title_hash_maps[downstream][title] = hashid
-            titles.append(title)
+        titles = subprocess.check_output(git_cmd).decode().strip().split('\n')
     except:
-        print('failed getting the downstream commits')
+        print('failed getting the upstream commits')
+        exit(1)
+
+    bloom = BloomFilter(len(titles))
+    for t in titles:
+        bloom.add(t.strip())
+    os.makedirs(filter_dir, exist_ok=True)
+    bloom.save(path)
+    upstream_title_filters[upstream] = bloom
+
+def streams_hashids(upstream, downstream, repo):
+    return [hash_by_ref(x, repo) for x in
+            upstream.split('..') + downstream.split('..')]
+
+def tracking_options(args, ignore_hashids):
+    "Return the options that affect the results, to check on resume"
+    prev_results = None
+    if args.prev_results:
+        with open(args.prev_results, 'rb') as f:
+            prev_results = hashlib.sha1(f.read()).hexdigest()
+    decorations = None
+    if normalize_title.decorations != None:
+        decorations = [x.pattern for x in normalize_title.decorations]
+    return {'titles': args.titles, 'all_files': args.all_files,
+            'downstream_prefix': args.downstream_prefix,
+            'ignore_hashids': sorted(ignore_hashids),
+            'ignore_trailers': args.ignore_trailers,
+            'title_decorations': decorations, 'prev_results': prev_results}
+
+def save_checkpoint(path, streams, options, results):
+    # the workers could be updating the caches
+    with caches_lock:
+        checkpoint = {'streams': streams, 'options': options,
+                'results': dict(results),
+                'title_hash_maps': {r: dict(m)
+                    for r, m in title_hash_maps.items()},
+                'filled_ranges': set(filled_ranges),
+                'hash_by_ref': {r: dict(c)
+                    for r, c in hash_by_ref.cache.items()},
+                'upstreams_comm': do_track.upstreams_comm,
+                'downstreams_comm': do_track.downstreams_comm}
+    # write to a temporal file first, not to corrupt the old checkpoint
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def load_checkpoint(path, streams, options):
+    "Restore caches from the checkpoint and return the results in it"
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint['streams'] != streams:
+        print('the checkpoint is for different streams')
         exit(1)
+    if checkpoint.get('options') != options:
+        print('the checkpoint is made with different options')
+        exit(1)
+
+    for revision_range, cache in checkpoint['title_hash_maps'].items():
+        if not revision_range in title_hash_maps:
+            title_hash_maps[revision_range] = {}
+        title_hash_maps[revision_range].update(cache)
+    filled_ranges.update(checkpoint['filled_ranges'])
+    for repo, cache in checkpoint['hash_by_ref'].items():
+        if not repo in hash_by_ref.cache:
+            hash_by_ref.cache[repo] = {}
+        hash_by_ref.cache[repo].update(cache)
+    do_track.upstreams_comm = checkpoint['upstreams_comm']
+    do_track.downstreams_comm = checkpoint['downstreams_comm']
+    return checkpoint['results']
+
+def append_history(store, track_results, upstream, downstream, repo):
+    record = {'time': int(time.time())}
+    for column, ref in [['up_start', upstream.split('..')[0]],
+            ['up_end', upstream.split('..')[-1]],
+            ['dn_start', downstream.split('..')[0]],
+            ['dn_end', downstream.split('..')[-1]]]:
+        record[column] = history.timestamp(
+                git.commit_date(hash_by_ref(ref, repo), repo))
+    for column, count in zip(history.columns[5:],
+            track_results.summary_counts()):
+        record[column] = count
+    history.append(store, record)
+
+def track_title(title, repo, upstream, downstream, downstream_prefix,
+        check_all_files, prev_results, ignore_hashids):
+    r = do_track(title, repo, upstream, downstream, downstream_prefix,
+            check_all_files, prev_results)
+
+    new_followup_fixes = []
+    for f in r.followup_fixes:
+        if f[0].commit_hash[:12] in ignore_hashids:
+            continue
+        new_followup_fixes.append(f)
+    r.followup_fixes = new_followup_fixes
+
+    new_followup_mentions = []
+    for m in r.followup_mentions:
+        if m[0].commit_hash[:12] in ignore_hashids:
+            continue
+        new_followup_mentions.append(m)
+    r.followup_mentions = new_followup_mentions
+    return r
+
+class TrackPipeline:
+    """Track titles in worker threads, so that git commands and the
+    classification of the commits for different titles are overlapped.
+
+    A producer thread feeds the titles to the workers via a bounded queue, and
+    'next_result()' returns the results in the order of the titles.  Titles
+    are fed only up to a fixed number ahead of the title to be returned, so
+    that the results waiting for the return are also bounded."""
+    titles_queue = None
+    slots = None
+    results = None
+    results_cond = None
+    stopped = None
+    threads = None
+
+    def __init__(self, titles, nr_workers, track_args):
+        self.titles_queue = queue.Queue(maxsize=nr_workers * 4)
+        self.slots = threading.Semaphore(nr_workers * 4)
+        self.results = {}
+        self.results_cond = threading.Condition()
+        self.stopped = threading.Event()
+
+        self.threads = [threading.Thread(target=self.produce,
+            args=(titles, nr_workers), daemon=True)]
+        for i in range(nr_workers):
+            self.threads.append(threading.Thread(target=self.work,
+                args=(track_args,), daemon=True))
+        for t in self.threads:
+            t.start()
+
+    def produce(self, titles, nr_workers):
+        for title in titles:
+            while not self.stopped.is_set():
+                if self.slots.acquire(timeout=1):
+                    break
+            while not self.stopped.is_set():
+                try:
+                    self.titles_queue.put(title, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+        for i in range(nr_workers):
+            while not self.stopped.is_set():
+                try:
+                    self.titles_queue.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def work(self, track_args):
+        while not self.stopped.is_set():
+            title = self.titles_queue.get()
+            if title == None:
+                return
+            try:
+                result = [track_title(title, *track_args), None]
+            except BaseException as e:
+                result = [None, e]
+            with self.results_cond:
+                self.results[title] = result
+                self.results_cond.notify_all()
+
+    def next_result(self, title, timeout=None):
+        "Return the result of the title, or None if not made in the timeout"
+        with self.results_cond:
+            if not self.results_cond.wait_for(lambda: title in self.results,
+                    timeout):
+                return None
+            result, exception = self.results.pop(title)
+        self.slots.release()
+        if exception:
+            self.stop()
+            raise exception
+        return result
+
+    def stop(self):
+        self.stopped.set()
+
+def read_priorities(priority_file):
+    "Return {title: priority} of the titles listed in the file"
+    priorities = {}
+    with open(priority_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            if not line in priorities:
+                priorities[line] = len(priorities)
+    return priorities
+
+def prioritize_titles(titles, priorities, upstream, downstream):
+    """Sort the titles to listed in the priorities, backported (having the
+    upstream commit trailers), and probably backported (in the upstream titles
+    filter) order.  The order is kept in each group, so recent first"""
+    def priority(title):
+        if title in priorities:
+            return [0, priorities[title]]
+        if (downstream in backport_indexes and
+                title in backport_indexes[downstream][1]):
+            return [1, 0]
+        if (upstream in upstream_title_filters and
+                title in upstream_title_filters[upstream]):
+            return [2, 0]
+        return [3, 0]
+    return sorted(titles, key=priority)
+
+def shard_titles(titles, shard):
+    "Return K-th of N contiguous partitions of titles, for shard 'K/N'"
+    try:
+        k, n = [int(x) for x in shard.split('/')]
+    except ValueError:
+        k, n = 0, 0
+    if n < 1 or k < 1 or k > n:
+        print('wrong shard \'%s\'' % shard)
+        exit(1)
+    print('# shard: %d/%d' % (k, n))
+    return titles[len(titles) * (k - 1) // n:len(titles) * k // n]
 
 def main():
     parser = argparse.ArgumentParser()
     set_argparser(parser)
     args = parser.parse_args()
+    start_time = time.time()
 
     repo = args.repo
 
@@ -309,6 +793,10 @@ def main():
         exit(1)
     upstream = args.upstream
 
+    if args.jobs < 1:
+        print('--jobs should be one or more')
+        exit(1)
+
     if not args.downstream:
         cmd = 'git --git-dir=%s/.git describe --abbrev=0' % repo
         try:
@@ -322,6 +810,19 @@ def main():
 
     pr_streams(upstream, downstream, repo)
 
+    if not args.ignore_trailers:
+        set_backport_index(downstream, repo)
+
+    if args.normalize_titles or args.title_decorations:
+        decorations = default_title_decorations
+        if args.title_decorations:
+            decorations = read_title_decorations(args.title_decorations)
+        normalize_title.decorations = [re.compile(x, re.IGNORECASE)
+                for x in decorations]
+
+    if args.upstream_filter_dir:
+        set_upstream_title_filter(upstream, repo, args.upstream_filter_dir)
+
     prev_res = None
     if args.prev_results:
         with open(args.prev_results, 'r') as f:
@@ -333,6 +834,17 @@ def main():
         titles = title_hash_maps[downstream].keys()
     else:
         titles = args.titles.strip().split('\n')
+    # the results are keyed by the titles
+    titles = list(dict.fromkeys(titles))
+
+    if args.shard:
+        titles = shard_titles(titles, args.shard)
+
+    if args.deadline != None or args.priority:
+        priorities = {}
+        if args.priority:
+            priorities = read_priorities(args.priority)
+        titles = prioritize_titles(titles, priorities, upstream, downstream)
 
     ignore_rules = {}
     if args.ignore_rule:
@@ -340,37 +852,76 @@ def main():
 
     ignore_hashids = []
     if len(ignore_rules) > 0:
-        if not args.titles:
-            fill_title_hash_maps(downstream, repo)
+        fill_title_hash_maps(downstream, repo)
         for trigger in ignore_rules:
             if trigger in title_hash_maps[downstream].values():
                 ignore_hashids += ignore_rules[trigger]
 
+    if args.resume and not args.checkpoint:
+        print('--resume requires --checkpoint')
+        exit(1)
+
+    if args.history and args.shard:
+        print('--history cannot be used with --shard.  Append the merged '
+                'output using \'summary_outputs.py --append_history\'')
+        exit(1)
+
+    streams = streams_hashids(upstream, downstream, repo)
+    options = tracking_options(args, ignore_hashids)
+    resumed = {}
+    if args.resume:
+        resumed = load_checkpoint(args.checkpoint, streams, options)
+    last_checkpoint = time.time()
+
+    track_progress = None
+    if args.progress or args.progress_file:
+        track_progress = progress.Progress(len(titles),
+                args.progress_interval, args.progress, args.progress_file)
+
     track_results = TrackResults()
     results = {}
     track_results.results = results
 
-    for t in titles:
-        results[t] = do_track(t, repo, upstream, downstream,
-                args.downstream_prefix, args.all_files, prev_res)
-        r = results[t]
+    pipeline = TrackPipeline([t for t in titles if not t in resumed],
+            args.jobs, [repo, upstream, downstream, args.downstream_prefix,
+                args.all_files, prev_res, ignore_hashids])
 
-        new_followup_fixes = []
-        for f in r.followup_fixes:
-            if f[0].commit_hash[:12] in ignore_hashids:
-                continue
-            new_followup_fixes.append(f)
-        r.followup_fixes = new_followup_fixes
+    for t in titles:
+        if args.deadline != None and (time.time() - start_time >=
+                args.deadline):
+            break
 
-        new_followup_mentions = []
-        for m in r.followup_mentions:
-            if m[0].commit_hash[:12] in ignore_hashids:
-                continue
-            new_followup_mentions.append(m)
-        r.followup_mentions = new_followup_mentions
+        if t in resumed:
+            r = resumed[t]
+        else:
+            timeout = None
+            if args.deadline != None:
+                # a slow title shouldn't overrun the deadline
+                timeout = max(start_time + args.deadline - time.time(), 0)
+            r = pipeline.next_result(t, timeout)
+            if r == None:
+                break
+        results[t] = r
 
         if not args.followups_only or (r.followup_fixes or r.followup_mentions):
-            print('%s #' % t, results[t])
+            print('%s #' % t, results[t], flush=True)
+
+        if track_progress:
+            track_progress.done()
+
+        if t in resumed:
+            continue
+
+        if args.checkpoint and (time.time() - last_checkpoint >=
+                args.checkpoint_interval):
+            save_checkpoint(args.checkpoint, streams, options, results)
+            last_checkpoint = time.time()
+    pipeline.stop()
+    if track_progress:
+        track_progress.stop()
+
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, streams, options, results)
 
     if not args.followups_only:
         print()
@@ -385,7 +936,14 @@ def main():
     print('SUMMARY')
     print('=======')
     print()
+    if len(results) < len(titles):
+        print('INCOMPLETE: %d of the %d downstream commits are tracked '
+                'before the deadline' % (len(results), len(titles)))
     print('\n'.join(track_results.summary_lines()))
 
+    if args.history and len(results) == len(titles):
+        append_history(args.history, track_results, upstream, downstream,
+                repo)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+import track_results
+
+def fmt_followup(followup, type_):
+    return '%s %s %s' % (type_[0], type_[1], followup)
+
+def diff_followups(old, new):
+    "Return lists of added, resolved, and changed followups"
+    added = []
+    resolved = []
+    changed = []
+    for followup, type_ in new.items():
+        if not followup in old:
+            added.append(fmt_followup(followup, type_))
+        elif old[followup] == type_:
+            continue
+        elif (old[followup] == [type_[0], 'unmerged'] and
+                type_[1] == 'merged'):
+            resolved.append(fmt_followup(followup, type_))
+        else:
+            changed.append('%s (was %s)' % (fmt_followup(followup, type_),
+                ' '.join(old[followup])))
+    for followup, type_ in old.items():
+        if not followup in new:
+            changed.append('removed %s (was %s)' % (followup, ' '.join(type_)))
+    return added, resolved, changed
+
+def diff_lines(title, old, new):
+    added, resolved, changed = diff_followups(old, new)
+    if not added and not resolved and not changed:
+        return []
+    lines = [title]
+    for name, followups in [['added', added], ['resolved', resolved],
+            ['changed', changed]]:
+        if followups:
+            lines.append('  %s' % name)
+            lines += ['    %s' % x for x in followups]
+    return lines
+
+def set_argparser(parser):
+    parser.add_argument('old', metavar='<file>',
+            help='file containing old output of chk-followups.py')
+    parser.add_argument('new', metavar='<file>',
+            help='file containing new output of chk-followups.py')
+    parser.description='show changed followups between two outputs.'
+
+def main():
+    parser = argparse.ArgumentParser()
+    set_argparser(parser)
+    args = parser.parse_args()
+
+    for output in [args.old, args.new]:
+        if not os.path.isfile(output):
+            print('%s not exist' % output)
+            exit(1)
+
+    # only the old results are kept in memory, the new are streamed
+    with open(args.old, 'r') as f:
+        old_results = {}
+        for title, followups in track_results.result_entries(f):
+            old_results[title] = followups
+
+    with open(args.new, 'r') as f:
+        for title, followups in track_results.result_entries(f):
+            lines = diff_lines(title, old_results.pop(title, {}), followups)
+            if lines:
+                print('\n'.join(lines))
+
+    # downstream commits that disappeared
+    for title, followups in old_results.items():
+        lines = diff_lines(title, followups, {})
+        if lines:
+            print('\n'.join(lines))
+
+if __name__ == '__main__':
+    main()
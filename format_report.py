@@ -2,6 +2,8 @@
 
 import argparse
 import datetime
+import hashlib
+import json
 import os
 
 import git
@@ -39,6 +41,18 @@ class Report:
             lines.append('# mentions \'%s\'' % m)
         return '\n'.join(lines)
 
+# NOTE: working directory should be the repo
+def applicability_key(mode, hashids, base):
+    """Return a key for applicability of the commits on the base, which changes
+    only if the files that the commits touch are changed in the base"""
+    paths = set()
+    for hashid in hashids:
+        paths.update(git.touched_files(hashid))
+    paths = sorted(paths)
+    blobs = git.blob_ids(base, paths)
+    key = [mode] + hashids + ['%s:%s' % (p, blobs.get(p, '-')) for p in paths]
+    return hashlib.sha1('\n'.join(key).encode()).hexdigest()
+
 def set_argparser(parser):
     parser.add_argument('output', metavar='<file>',
             help='file containing output of chk-followups.py')
@@ -56,6 +70,10 @@ def set_argparser(parser):
             help='Email Cc:')
     parser.add_argument('--bcc', metavar='<email>', nargs='+',
             help='Email Bcc:')
+    parser.add_argument('--series', action='store_true',
+            help='check applicability of the commits as one series')
+    parser.add_argument('--applicable_cache', metavar='<file>',
+            help='file to store and reuse the applicability check results')
 
 def main():
     parser = argparse.ArgumentParser()
@@ -89,24 +107,66 @@ def main():
             report.mentions.append(t)
 
     # Check if the commits are cleanly applicable
+    # {mode: {key: verdicts}}
+    cache = {}
+    if args.applicable_cache and os.path.isfile(args.applicable_cache):
+        with open(args.applicable_cache, 'r') as f:
+            cache = json.load(f)
+    mode = 'single'
+    if args.series:
+        mode = 'series'
+    verdicts = cache.get(mode, {})
+    used_verdicts = {}
+
+    series_break = None
     if len(to_report) > 0:
         cwd = os.getcwd()
         os.chdir(args.repo)
         original_head = git.head_hashid()
-
         downstream_end = prev_res.downstream[-1]
-        git.reset_hard(downstream_end)
-
-    for report in to_report.values():
-        if git.applicable(report.commit.commit_hash, downstream_end):
-            report.applicable = True
+        nr_computed = 0
+
+        if not args.series:
+            for report in to_report.values():
+                hashid = report.commit.commit_hash
+                key = applicability_key(mode, [hashid], downstream_end)
+                if not key in verdicts:
+                    verdicts[key] = [git.applicable(hashid, downstream_end)]
+                    nr_computed += 1
+                used_verdicts[key] = verdicts[key]
+                report.applicable = verdicts[key][0]
         else:
-            report.applicable = False
-
-    if len(to_report) > 0:
-        git.reset_hard(original_head)
+            # the commits could depend on each other.  Apply those in the
+            # upstream order, each on top of the previous cleanly applicable
+            # ones.
+            series = git.sort_topologically(
+                    [r.commit.commit_hash for r in to_report.values()],
+                    downstream_end)
+            reports = {r.commit.commit_hash: r for r in to_report.values()}
+            key = applicability_key(mode, series, downstream_end)
+            if not key in verdicts:
+                verdicts[key] = git.applicable_series(series, downstream_end)
+                nr_computed += 1
+            used_verdicts[key] = verdicts[key]
+            for hashid, applicable in zip(series, verdicts[key]):
+                reports[hashid].applicable = applicable
+                if not applicable and not series_break:
+                    series_break = reports[hashid].commit
+
+        # the series is applied in a temporary worktree
+        if nr_computed > 0 and not args.series:
+            git.reset_hard(original_head)
         os.chdir(cwd)
 
+    # keep the cache as is if no verdict is looked up, and keep the verdicts
+    # of the other mode
+    if args.applicable_cache and used_verdicts:
+        cache[mode] = used_verdicts
+        # write to a temporal file first, not to corrupt the old cache
+        with open(args.applicable_cache + '.tmp', 'w') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(args.applicable_cache + '.tmp', args.applicable_cache)
+
     # Print the report
 
     authors = {}
@@ -131,6 +191,16 @@ def main():
     if args.sender:
         print('\nFrom: %s' % args.sender)
 
+    series_note = ''
+    if args.series:
+        series_note = """The commits are checked for the clean applicability as a series, in the
+upstream commit order.  That is, each commit is applied on top of the previous
+cleanly applicable commits.
+"""
+        if series_break:
+            series_note += 'The series first breaks at %s.\n' % series_break
+        series_note += '\n'
+
     print("""
 Hello,
 
@@ -139,13 +209,13 @@ We found below %d commits in the '%s (upstream)' seems fixing or mentioning
 commits in the '%s (downstream)' but are not merged in the 'downstream' yet.
 Could you please review if those need to be merged in?
 
-A commit is considered as fix of another if the complete 'Fixed:' tag is in the
-commit message.  If the tag is not found but the commit message contains the
-title or the hash id of the other commit, it is considered mentioning it.  So,
-the 'mentions' might have many false positives, but it could cover the typos (I
-found such cases before).
+A commit is considered as fix of another if a 'Fixes:' tag in the commit
+message refers to the hash id of the other commit.  If the tag is not found but
+the commit message contains the title or the hash id of the other commit, it is
+considered mentioning it.  So, the 'mentions' might have many false positives,
+but it could cover the typos (I found such cases before).
 
-The commits are grouped as 'fixes cleanly applicable', 'fixes not cleanly
+%sThe commits are grouped as 'fixes cleanly applicable', 'fixes not cleanly
 applicable (need manual backporting to be applied)', 'mentions cleanly
 applicable', and 'mentions not cleanly applicable'.  Also, the commits in each
 group are sorted by the commit dates (oldest first).
@@ -161,7 +231,8 @@ don't bother you again.
 
 [1] https://github.com/sjp38/stream-track
 """ % (len(to_report),
-    '..'.join(prev_res.upstream), '..'.join(prev_res.downstream)))
+    '..'.join(prev_res.upstream), '..'.join(prev_res.downstream),
+    series_note))
 
     if args.sender:
         print('\nThanks,\n%s\n\n' % ' '.join(args.sender.split()[:-1]))
@@ -2,6 +2,7 @@
 
 import datetime
 import subprocess
+import tempfile
 import traceback
 
 def commit_date(hashid, repo):
@@ -27,6 +28,37 @@ def head_hashid(repo=None):
     cmd = git_cmd + 'show --pretty=%H --quiet'
     return subprocess.check_output(cmd, shell=True).decode().strip()
 
+def sort_topologically(hashids, base):
+    "Sort the commits that not reachable from base, oldest first"
+    if not hashids:
+        return []
+    cmd = 'git rev-list --topo-order --reverse %s ^%s' % (
+            ' '.join(hashids), base)
+    order = {}
+    output = subprocess.check_output(cmd, shell=True).decode().strip()
+    for idx, hashid in enumerate(output.split('\n')):
+        order[hashid] = idx
+    return sorted(hashids, key=lambda h: order.get(h, -1))
+
+def touched_files(hashid):
+    cmd = ['git', 'show', hashid, '--pretty=', '--name-only', '--no-renames']
+    output = subprocess.check_output(cmd).decode().strip()
+    return [x for x in output.split('\n') if x]
+
+def blob_ids(ref, paths):
+    "Return {path: blob id} of the paths in ref.  Absent paths are omitted"
+    if not paths:
+        return {}
+    cmd = ['git', 'ls-tree', '-z', ref, '--'] + paths
+    output = subprocess.check_output(cmd).decode()
+    blobs = {}
+    for entry in output.split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        blobs[path] = info.split()[2]
+    return blobs
+
 def reset_hard(ref):
     cmd = 'git reset --hard %s' % ref
     subprocess.check_output(cmd, shell=True)
@@ -52,3 +84,34 @@ def applicable(hashid, base):
 
     reset_hard(original_hashid)
     return True
+
+# NOTE: working directory should be the repo
+def applicable_series(hashids, base):
+    """Cherry-pick the commits on the base in the order, skipping commits
+    that not cleanly applicable.  Return the applicability of the commits.
+
+    The series is applied in a temporary worktree, so the working tree and
+    HEAD of the repo are not touched"""
+    worktree = tempfile.mkdtemp(prefix='stream-track-')
+    cmd = ['git', 'worktree', 'add', '--detach', worktree, base]
+    subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+
+    results = []
+    try:
+        for hashid in hashids:
+            cmd = ['git', '-C', worktree, 'cherry-pick', hashid]
+            try:
+                subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+                results.append(True)
+            except subprocess.CalledProcessError as e:
+                try:
+                    cmd = ['git', '-C', worktree, 'cherry-pick', '--abort']
+                    subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+                except Exception as e:
+                    print('failed aborting cherry-pick!', e)
+                    exit(1)
+                results.append(False)
+    finally:
+        cmd = ['git', 'worktree', 'remove', '--force', worktree]
+        subprocess.call(cmd)
+    return results
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import array
+import datetime
+import os
+
+"""
+Columnar store of the tracking summaries.  A store is a directory having one
+file per column.  Each file is an array of 64 bit integers, which appended per
+tracking.  Dates are stored as seconds since the epoch.
+"""
+
+columns = ['time', 'up_start', 'up_end', 'dn_start', 'dn_end',
+        'nr_commits', 'nr_backported', 'nr_fixed', 'nr_fixed_unapplied',
+        'nr_mentioned', 'nr_mentioned_unapplied']
+
+def timestamp(date):
+    return int(date.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+def date_of(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+def append(store, record):
+    "Append a record, which is {column: int}, to the store"
+    os.makedirs(store, exist_ok=True)
+    for column in columns:
+        with open(os.path.join(store, column), 'ab') as f:
+            array.array('q', [record[column]]).tofile(f)
+
+def load(store):
+    "Return {column: array} of the store"
+    loaded = {}
+    for column in columns:
+        values = array.array('q')
+        path = os.path.join(store, column)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            values.frombytes(data[:len(data) // values.itemsize *
+                values.itemsize])
+        loaded[column] = values
+    # an interrupted append could leave the columns with different lengths
+    nr_records = min([len(x) for x in loaded.values()])
+    for column in columns:
+        del loaded[column][nr_records:]
+    return loaded
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+import summary_outputs
+
+class ShardOutput:
+    shard = None
+    head_lines = None
+    body_lines = None
+    highlight_lines = None
+    summary = None
+
+    def __init__(self):
+        self.head_lines = []
+        self.body_lines = []
+
+def parse_shard_output(lines):
+    output = ShardOutput()
+    section = output.body_lines
+    for idx, line in enumerate(lines):
+        line = line.rstrip('\n')
+        next_line = None
+        if idx + 1 < len(lines):
+            next_line = lines[idx + 1].rstrip('\n')
+        if line == 'HIGHLIGHTS' and next_line == '==========':
+            output.highlight_lines = []
+            section = output.highlight_lines
+            continue
+        if line == 'SUMMARY' and next_line == '=======':
+            summary_lines = lines[idx:idx + 6]
+            # truncated or stopped by the deadline
+            if (len(summary_lines) == 6 and
+                    not summary_lines[3].startswith('INCOMPLETE: ') and
+                    summary_lines[5].rstrip('\n').endswith('downstream)')):
+                try:
+                    output.summary = summary_outputs.parse_summary(
+                            summary_lines)
+                except (IndexError, ValueError):
+                    output.summary = None
+            break
+        if line in ['', '==========']:
+            continue
+        if line.startswith('# shard: '):
+            output.shard = [int(x) for x in line[len('# shard: '):].split('/')]
+            continue
+        if not output.body_lines and line.startswith('# '):
+            output.head_lines.append(line)
+            continue
+        section.append(line)
+    return output
+
+def merge_outputs(outputs):
+    outputs = sorted(outputs, key=lambda x: x.shard)
+    nr_shards = outputs[0].shard[1]
+    if [x.shard for x in outputs] != [[k, nr_shards]
+            for k in range(1, nr_shards + 1)]:
+        print('shards are missing or duplicated')
+        exit(1)
+    for o in outputs:
+        if o.head_lines != outputs[0].head_lines:
+            print('shard %d/%d is for different streams' % tuple(o.shard))
+            exit(1)
+        if not o.summary:
+            print('shard %d/%d is incomplete' % tuple(o.shard))
+            exit(1)
+        if (o.highlight_lines == None) != (
+                outputs[0].highlight_lines == None):
+            print('shard %d/%d has different sections' % tuple(o.shard))
+            exit(1)
+
+    lines = list(outputs[0].head_lines)
+    for o in outputs:
+        lines += o.body_lines
+
+    if outputs[0].highlight_lines != None:
+        lines += ['', '', 'HIGHLIGHTS', '==========', '']
+        for o in outputs:
+            lines += o.highlight_lines
+
+    summary = summary_outputs.Summary()
+    for field in ['nr_commits', 'nr_backported', 'nr_fixed',
+            'nr_fixed_unapplied', 'nr_mentioned', 'nr_mentioned_unapplied']:
+        setattr(summary, field,
+                sum([getattr(o.summary, field) for o in outputs]))
+    lines += ['', '', 'SUMMARY', '=======', '']
+    lines.append(
+            '%d of the %d downstream commits are merged in the upstream.' %
+            (summary.nr_backported, summary.nr_commits))
+    lines.append('%d followup fixes found (%d are not applied downstream)'
+            % (summary.nr_fixed, summary.nr_fixed_unapplied))
+    lines.append(
+            '%d followup mentions found (%d are not applied downstream)' %
+            (summary.nr_mentioned, summary.nr_mentioned_unapplied))
+    return lines
+
+def set_argparser(parser):
+    parser.add_argument('outputs', metavar='<file>', nargs='+',
+            help='files containing output of \'chk-followups.py --shard\'')
+    parser.description='merge outputs of sharded chk-followups.py runs.'
+
+def main():
+    parser = argparse.ArgumentParser()
+    set_argparser(parser)
+    args = parser.parse_args()
+
+    outputs = []
+    for output in args.outputs:
+        if not os.path.isfile(output):
+            print('%s not exist' % output)
+            exit(1)
+        with open(output, 'r') as f:
+            parsed = parse_shard_output(f.readlines())
+        if not parsed.shard:
+            print('%s is not an output of a shard' % output)
+            exit(1)
+        outputs.append(parsed)
+
+    print('\n'.join(merge_outputs(outputs)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+import sys
+import threading
+import time
+
+# {counter name: count}, e.g., 'git_calls', '<cache>_hits', '<cache>_misses'
+counters = collections.defaultdict(int)
+counters_lock = threading.Lock()
+
+def count(name, nr=1):
+    with counters_lock:
+        counters[name] += nr
+
+def fmt_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+    return '%dm%02ds' % (seconds // 60, seconds % 60)
+
+class Progress:
+    nr_total = None
+    nr_done = None
+    interval = None
+    status_file = None
+    to_stderr = None
+    last_report = None
+    last_done = None
+    samples = None  # [(time, nr_done, nr_git_calls) ...]
+    report_lock = None
+    stopped = None
+
+    def __init__(self, nr_total, interval, to_stderr, status_file):
+        self.nr_total = nr_total
+        self.nr_done = 0
+        self.interval = interval
+        self.to_stderr = to_stderr
+        self.status_file = status_file
+        self.last_report = time.time()
+        self.last_done = self.last_report
+        # rates are moving averages of the last few reporting intervals
+        self.samples = collections.deque(maxlen=10)
+        self.samples.append(
+                (self.last_report, 0, counters.get('git_calls', 0)))
+        self.report_lock = threading.Lock()
+
+        # report even if no commit is done for long, to show stalls
+        self.stopped = threading.Event()
+        threading.Thread(target=self.report_periodically, daemon=True).start()
+
+    def report_periodically(self):
+        while not self.stopped.wait(max(self.interval, 1)):
+            self.report()
+
+    def cache_hit_rates(self):
+        rates = []
+        with counters_lock:
+            snapshot = dict(counters)
+        for name in sorted(snapshot):
+            if not name.endswith('_hits'):
+                continue
+            cache = name[:-len('_hits')]
+            nr_lookups = snapshot[name] + snapshot.get(cache + '_misses', 0)
+            if nr_lookups:
+                rates.append('%s %.1f%%' %
+                        (cache, snapshot[name] * 100.0 / nr_lookups))
+        return ', '.join(rates)
+
+    def status(self):
+        now = time.time()
+        self.samples.append((now, self.nr_done, counters.get('git_calls', 0)))
+        start = self.samples[0]
+        elapsed = max(now - start[0], 0.001)
+        commits_rate = (self.nr_done - start[1]) / elapsed
+        git_rate = (counters.get('git_calls', 0) - start[2]) / elapsed
+
+        nr_remaining = self.nr_total - self.nr_done
+        eta = 'unknown'
+        if commits_rate > 0:
+            eta = fmt_duration(nr_remaining / commits_rate)
+        return ('%s: %d/%d commits (%d remaining), last done %s ago, '
+                '%.2f commits/s, %.2f git calls/s, cache hits: %s, eta: %s' % (
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)),
+                    self.nr_done, self.nr_total, nr_remaining,
+                    fmt_duration(now - self.last_done), commits_rate,
+                    git_rate, self.cache_hit_rates() or 'none', eta))
+
+    def report(self):
+        with self.report_lock:
+            status = self.status()
+            if self.to_stderr:
+                print('# progress: %s' % status, file=sys.stderr)
+            if self.status_file:
+                with open(self.status_file + '.tmp', 'w') as f:
+                    f.write(status + '\n')
+                os.replace(self.status_file + '.tmp', self.status_file)
+            self.last_report = time.time()
+
+    def done(self, nr=1):
+        self.nr_done += nr
+        self.last_done = time.time()
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def stop(self):
+        self.stopped.set()
+        self.report()
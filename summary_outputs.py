@@ -6,6 +6,7 @@ import os
 import subprocess
 
 import git
+import history
 import track_results
 
 class Summary:
@@ -47,23 +48,62 @@ def parse_summary(lines):
 def fmt_date_range(start, end):
     return '%s..%s' % (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
 
-def parse_pr_summary(prefix, output_lines, repo):
+def summary_record(output_lines, repo, time):
+    "Return a history record of the output, or None if it is incomplete"
     results = track_results.parse_track_results(output_lines[:10], repo)
     upstream = results.upstream
     downstream = results.downstream
     hashes = results.hashids
     if not upstream or not downstream or not hashes:
-        return
-
-    up = fmt_date_range(git.commit_date(hashes[upstream[0]], repo),
-            git.commit_date(hashes[upstream[1]], repo))
-    dn = fmt_date_range(git.commit_date(hashes[downstream[0]], repo),
-            git.commit_date(hashes[downstream[1]], repo))
+        return None
 
     summary = parse_summary(output_lines[-6:])
     if not summary:
+        return None
+
+    record = {'time': time}
+    for column, ref in [['up_start', upstream[0]], ['up_end', upstream[-1]],
+            ['dn_start', downstream[0]], ['dn_end', downstream[-1]]]:
+        record[column] = history.timestamp(git.commit_date(hashes[ref], repo))
+    for column in history.columns[5:]:
+        record[column] = getattr(summary, column)
+    return record
+
+def fmt_record(prefix, record):
+    summary = Summary()
+    for column in history.columns[5:]:
+        setattr(summary, column, record[column])
+    up = fmt_date_range(history.date_of(record['up_start']),
+            history.date_of(record['up_end']))
+    dn = fmt_date_range(history.date_of(record['dn_start']),
+            history.date_of(record['dn_end']))
+    return '%s\t%s\t# up: %s dn: %s' % (prefix, summary, up, dn)
+
+def parse_pr_summary(prefix, output_lines, repo):
+    record = summary_record(output_lines, repo, 0)
+    if not record:
         return
-    print('%s\t%s\t# up: %s dn: %s' % (prefix, summary, up, dn))
+    print(fmt_record(prefix, record))
+
+def history_records(store, since, until):
+    """Return records in the store that made in [since, until), in the time
+    order.  Backfilled records could be appended out of the order"""
+    columns = history.load(store)
+    records = []
+    for idx, time in enumerate(columns['time']):
+        if since and time < since:
+            continue
+        if until and time >= until:
+            continue
+        records.append({c: columns[c][idx] for c in history.columns})
+    return sorted(records, key=lambda r: r['time'])
+
+def pr_history_aggregate(branch, records):
+    for name, aggregate in [['min', min], ['max', max],
+            ['avg', lambda x: sum(x) // len(x)]]:
+        record = {c: aggregate([r[c] for r in records])
+                for c in history.columns}
+        print(fmt_record('%s/%s' % (branch, name), record))
 
 def pr_comments_legends(max_filename_len):
     print('# cmmt: The downstream commits')
@@ -77,18 +117,93 @@ def pr_comments_legends(max_filename_len):
     print('\t'.join('file cmmt port fixs ufix mntn umnt'.split()))
 
 def set_argparser(parser):
-    parser.add_argument('outputs', metavar='<file>', nargs='+',
+    parser.add_argument('outputs', metavar='<file>', nargs='*',
             help='files containing output of chk-followups.py')
     parser.add_argument('--repo', metavar='<path>', default='./',
             help='path to the tracking git repo')
     parser.add_argument('--brief', action='store_true',
             help='exclude comments and legends from the output')
+    parser.add_argument('--append_history', metavar='<dir>',
+            help='append the summaries of the outputs to the history store')
+    parser.add_argument('--history_time', metavar='<YYYY-MM-DD>',
+            help='time of the appended summaries (default: upstream end date)')
+    parser.add_argument('--history', metavar='<dir>', nargs='+',
+            help='show the summaries in the history stores, not the outputs')
+    parser.add_argument('--since', metavar='<YYYY-MM-DD>',
+            help='show only the history made since the date')
+    parser.add_argument('--until', metavar='<YYYY-MM-DD>',
+            help='show only the history made before the date')
+    parser.add_argument('--aggregate', action='store_true',
+            help='show min, max, and average of the history of each store')
+
+def pr_history(args):
+    since = None
+    if args.since:
+        since = history.timestamp(
+                datetime.datetime.strptime(args.since, '%Y-%m-%d'))
+    until = None
+    if args.until:
+        until = history.timestamp(
+                datetime.datetime.strptime(args.until, '%Y-%m-%d'))
+
+    branch_records = []
+    for store in args.history:
+        if not os.path.isdir(store):
+            print('%s not exist' % store)
+            continue
+        branch = os.path.basename(os.path.normpath(store))
+        branch_records.append(
+                [branch, history_records(store, since, until)])
+
+    if not args.brief:
+        prefix_lengths = [len(b) + 4 for b, r in branch_records]
+        if not args.aggregate:
+            prefix_lengths = [len(b) + 11 for b, r in branch_records]
+        pr_comments_legends(max(prefix_lengths + [4]))
+
+    for branch, records in branch_records:
+        if args.aggregate:
+            if records:
+                pr_history_aggregate(branch, records)
+            continue
+        for r in records:
+            print(fmt_record('%s/%s' % (
+                history.date_of(r['time']).strftime('%Y-%m-%d'), branch), r))
 
 def main():
     parser = argparse.ArgumentParser()
     set_argparser(parser)
     args = parser.parse_args()
 
+    if args.history:
+        pr_history(args)
+        return
+
+    if not args.outputs:
+        print('outputs are not given')
+        parser.print_help()
+        exit(1)
+
+    if args.append_history:
+        time = None
+        if args.history_time:
+            time = history.timestamp(
+                    datetime.datetime.strptime(args.history_time, '%Y-%m-%d'))
+        for output in args.outputs:
+            if not os.path.isfile(output):
+                print('%s not exist' % output)
+                continue
+            with open(output, 'r') as f:
+                record = summary_record(f.readlines(), args.repo, time)
+            if not record:
+                continue
+            # mtimes of archived outputs are unreliable.  The upstream is
+            # usually updated just before the tracking.
+            if record['time'] == None:
+                record['time'] = record['up_end']
+            history.append(args.append_history, record)
+        return
+
     filename_lengths = [len(output) for output in args.outputs]
     maxlen = max(filename_lengths)
 
@@ -1,18 +1,68 @@
 #!/usr/bin/env python3
 
+import re
 import subprocess
 
+import progress
+
+fixes_tag_pattern = re.compile(
+        r'^fixes:\s*([0-9a-f]{7,40})\b\s*(?:\((.*)\))?', re.IGNORECASE)
+
+def parse_fixes_tags(msg):
+    "Return [[hash prefix, title or None] ...] of the 'Fixes:' tags in msg"
+    tags = []
+    lines = msg.split('\n')
+    for idx, line in enumerate(lines):
+        line = line.strip()
+        if not line.lower().startswith('fixes:'):
+            continue
+        # the title could be wrapped over multiple lines
+        for next_line in lines[idx + 1:]:
+            if line.count('(') <= line.count(')'):
+                break
+            if next_line.strip() == '':
+                break
+            line += ' ' + next_line.strip()
+        m = fixes_tag_pattern.match(line)
+        if not m:
+            continue
+        title = m.group(2)
+        if title != None:
+            title = title.strip().strip('"\'“”')
+        tags.append([m.group(1).lower(), title])
+    return tags
+
+upstream_trailer_patterns = [
+        re.compile(r'^commit ([0-9a-f]{12,40}) upstream\.?$', re.IGNORECASE),
+        re.compile(r'^\[ upstream commit ([0-9a-f]{12,40}) \]$', re.IGNORECASE),
+        re.compile(r'^\(cherry picked from commit ([0-9a-f]{7,40})\)$',
+            re.IGNORECASE)]
+
+def parse_upstream_trailers(msg):
+    "Return hash ids of the origin commits that the backport msg records"
+    hashids = []
+    for line in msg.split('\n'):
+        line = line.strip()
+        for pattern in upstream_trailer_patterns:
+            m = pattern.match(line)
+            if m:
+                hashids.append(m.group(1).lower())
+    return hashids
+
 class Commit:
     gitref = None
     commit_hash = None
     title = None
     msg = None
+    fixes_tags = None
+    fixes_index = None
 
     def __init__(self, gitref, repo):
         self.gitref = gitref
 
         git_cmd = ['git', '--git-dir=%s/.git' % repo]
         git_cmd += ['show', '%s' % gitref, '--pretty=%H%n%B', '--quiet']
+        progress.count('git_calls')
         git_log = subprocess.check_output(git_cmd).decode().strip()
 
         log_lines = git_log.split('\n')
@@ -20,12 +70,29 @@ class Commit:
         self.title = log_lines[1]
         self.msg = '\n'.join(log_lines[2:])
 
+        # {length of prefix: {hash prefix: title}}
+        self.fixes_tags = parse_fixes_tags(self.msg)
+        self.fixes_index = {}
+        for prefix, title in self.fixes_tags:
+            if not len(prefix) in self.fixes_index:
+                self.fixes_index[len(prefix)] = {}
+            self.fixes_index[len(prefix)][prefix] = title
+
     def __str__(self):
         return '%s ("%s")' % (self.commit_hash[:12], self.title)
 
     def is_fix_of(self, commit):
-        fixes_tag = 'Fixes: %s ("%s")' % (commit.commit_hash[:12], commit.title)
-        return fixes_tag in self.msg
+        for prefix_len in self.fixes_index:
+            prefix = commit.commit_hash[:prefix_len]
+            if not prefix in self.fixes_index[prefix_len]:
+                continue
+            title = self.fixes_index[prefix_len][prefix]
+            # short prefixes could be shared, so confirm with the title
+            if prefix_len < 12 and title != None and (
+                    ' '.join(title.split()) != ' '.join(commit.title.split())):
+                continue
+            return True
+        return False
 
     def mentioned(self, commit):
         if self.title.lower().startswith('merge '):
@@ -115,40 +182,27 @@ class TrackResults:
             lines.append('%s # %s' % (title, r))
         return lines
 
+    def summary_counts(self):
+        """Return numbers of the downstream commits, the backported commits, the
+        followup fixes, the unmerged fixes, the mentions, and the unmerged
+        mentions"""
+        results = self.results.values()
+        fixes = [f for r in results for f in r.followup_fixes]
+        mentions = [m for r in results for m in r.followup_mentions]
+        return [len(results), len([x for x in results if x.upstream_commit]),
+                len(fixes), len([f for f in fixes if f[1] == None]),
+                len(mentions), len([m for m in mentions if m[1] == None])]
+
     def summary_lines(self):
-        results = self.results
+        (nr_commits, nr_backported, nr_fixes, nr_unmerged_fixes, nr_mentions,
+                nr_unmerged_mentions) = self.summary_counts()
         lines = []
 
         lines.append(
                 '%d of the %d downstream commits are merged in the upstream.' %
-                (len([x for x in results.values() if x.upstream_commit]),
-                    len(results)))
-
-        nr_fixed = 0
-        nr_fixes = 0
-        nr_unmerged_fixes = 0
-        for r in results.values():
-            if r.followup_fixes:
-                nr_fixed += 1
-                nr_fixes += len(r.followup_fixes)
-                for f in r.followup_fixes:
-                    if f[1] == None:
-                        nr_unmerged_fixes += 1
-
+                (nr_backported, nr_commits))
         lines.append('%d followup fixes found (%d are not applied downstream)'
                 % (nr_fixes, nr_unmerged_fixes))
-
-        nr_mentioned = 0
-        nr_mentions = 0
-        nr_unmerged_mentions = 0
-        for r in results.values():
-            if r.followup_mentions:
-                nr_mentioned += 1
-                nr_mentions += len(r.followup_mentions)
-                for f in r.followup_mentions:
-                    if f[1] == None:
-                        nr_unmerged_mentions += 1
-
         lines.append(
                 '%d followup mentions found (%d are not applied downstream)' %
                 (nr_mentions, nr_unmerged_mentions))
@@ -227,3 +281,29 @@ def parse_track_results(results_lines, repo):
             if comment not in ['downstream_only', 'no_followup']:
                 result = results[title]
     return parsed
+
+def result_entries(results_lines):
+    """Yield [title, {followup: [type ('fixes' or 'mentions'), state ('merged'
+    or 'unmerged')]}] of the results, without reading the git repo"""
+    entry = None
+    type_ = None
+    for line in results_lines:
+        line = line.rstrip()
+        if line == '':
+            break
+        if line.startswith('# '):
+            continue
+        if entry and line in ['  mentions merged', '  mentions unmerged',
+                '  fixes merged', '  fixes unmerged']:
+            type_ = line.strip().split()
+            continue
+        if entry and line.startswith('    '):
+            entry[1][line.strip()] = type_
+            continue
+        if entry:
+            yield entry
+        comments_start = line.rfind(' # ')
+        entry = [line[:comments_start], {}]
+        type_ = None
+    if entry:
+        yield entry